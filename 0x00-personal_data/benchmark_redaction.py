@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+'''
+Benchmark of the redaction strategies of filtered_logger,
+reports the throughput (lines/sec) and the latency per line
+of every strategy for synthetic log lines
+
+usage: ./benchmark_redaction.py [--lines N] [--fields N ...] [--density D ...]
+'''
+
+
+import argparse
+import logging
+import random
+import re
+import string
+import time
+from typing import Callable, Dict, List
+
+from filtered_logger import (PII_FIELDS, RedactingFormatter, filter_datum,
+                             redact_row, serialize_row)
+
+
+SEPARATOR = RedactingFormatter.SEPARATOR
+REDACTION = RedactingFormatter.REDACTION
+
+
+def _random_value(length: int = 12) -> str:
+    '''a random value without the separator'''
+    return ''.join(random.choices(string.ascii_letters + string.digits,
+                                  k=length))
+
+
+def generate_rows(count: int, fields: int,
+                  density: float) -> List[Dict[str, str]]:
+    '''
+    generate synthetic rows
+    parameters:
+        - count: the number of rows
+        - fields: the number of fields per row
+        - density: the share of rows carrying PII fields
+    '''
+    rows = []
+    for _ in range(count):
+        row = {f'field_{index}': _random_value() for index in range(fields)}
+        if random.random() < density:
+            for field in PII_FIELDS:
+                row[field] = _random_value()
+        rows.append(row)
+    return rows
+
+
+def to_message(row: Dict[str, str]) -> str:
+    '''render a row as a `field=value;` log line'''
+    return ''.join(f'{field}={value}{SEPARATOR}'
+                   for field, value in row.items())
+
+
+def per_field_regex(message: str) -> str:
+    '''the original strategy: one re.sub per field'''
+    for field in PII_FIELDS:
+        message = re.sub(fr'({field})=([^{SEPARATOR}]+)',
+                         f'\\1={REDACTION}', message)
+    return message
+
+
+def single_pass(message: str) -> str:
+    '''filter_datum: one compiled pattern for all the fields'''
+    return filter_datum(PII_FIELDS, REDACTION, message, SEPARATOR)
+
+
+def make_formatter_strategy() -> Callable[[str], str]:
+    '''RedactingFormatter, including its no-PII fast path'''
+    formatter = RedactingFormatter(PII_FIELDS)
+
+    def format_message(message: str) -> str:
+        record = logging.LogRecord('user_data', logging.INFO, __file__, 0,
+                                   message, None, None)
+        return formatter.format(record)
+
+    return format_message
+
+
+def structured(row: Dict[str, str]) -> str:
+    '''mask the row by column name then serialize it'''
+    return serialize_row(redact_row(row))
+
+
+def run(strategy: Callable, inputs: list, repeat: int = 3) -> float:
+    '''returns the best time in seconds to run strategy over the inputs'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            strategy(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    '''main function'''
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lines', type=int, default=10000)
+    parser.add_argument('--fields', type=int, nargs='+', default=[3, 10, 30])
+    parser.add_argument('--density', type=float, nargs='+',
+                        default=[0.0, 0.1, 1.0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    strategies = {
+        'per_field_regex': (per_field_regex, False),
+        'filter_datum': (single_pass, False),
+        'formatter': (make_formatter_strategy(), False),
+        'structured': (structured, True),
+    }
+
+    print(f'{"strategy":<16} {"fields":>6} {"density":>7} '
+          f'{"lines/sec":>12} {"us/line":>8}')
+    for fields in args.fields:
+        for density in args.density:
+            rows = generate_rows(args.lines, fields, density)
+            messages = [to_message(row) for row in rows]
+            for name, (strategy, takes_rows) in strategies.items():
+                inputs = rows if takes_rows else messages
+                elapsed = run(strategy, inputs, args.repeat)
+                print(f'{name:<16} {fields:>6} {density:>7.2f} '
+                      f'{args.lines / elapsed:>12,.0f} '
+                      f'{elapsed / args.lines * 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,74 @@
 #!/usr/bin/env python3
 '''Encrypting passwords'''
 
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from queue import Full
+from typing import Optional, Tuple
+
 import bcrypt
 
 
-def hash_password(password: str) -> bytes:
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+_rounds = None
+
+
+def calibrate_rounds(target_ms: float = 250, min_rounds: int = MIN_ROUNDS,
+                     max_rounds: int = MAX_ROUNDS) -> int:
+    '''
+    find the highest bcrypt work factor whose hashing time on this
+    host stays under target_ms, each extra round doubles the time
+    Return:
+        - the work factor (at least min_rounds)
+    '''
+    rounds = min_rounds
+    elapsed = _time_hash(rounds)
+    while rounds < max_rounds and elapsed * 2 <= target_ms:
+        rounds += 1
+        elapsed = _time_hash(rounds)
+    if elapsed > target_ms and rounds > min_rounds:
+        rounds -= 1
+    return rounds
+
+
+def _time_hash(rounds: int) -> float:
+    '''the time in milliseconds to hash a password with rounds'''
+    start = time.perf_counter()
+    bcrypt.hashpw(b'calibration', bcrypt.gensalt(rounds))
+    return (time.perf_counter() - start) * 1000
+
+
+def get_rounds() -> int:
+    '''
+    the work factor used for new hashes, computed once:
+        - BCRYPT_ROUNDS if set
+        - calibrated for BCRYPT_TARGET_MS milliseconds if set
+        - DEFAULT_ROUNDS otherwise
+    '''
+    global _rounds
+
+    if _rounds is None:
+        if os.getenv('BCRYPT_ROUNDS'):
+            _rounds = int(os.getenv('BCRYPT_ROUNDS'))
+        elif os.getenv('BCRYPT_TARGET_MS'):
+            _rounds = calibrate_rounds(float(os.getenv('BCRYPT_TARGET_MS')))
+        else:
+            _rounds = DEFAULT_ROUNDS
+    return _rounds
+
+
+def hash_password(password: str, rounds: int = None) -> bytes:
     '''hashing the password'''
 
     bytes_pass = password.encode('utf-8')
-    hash = bcrypt.hashpw(bytes_pass, bcrypt.gensalt())
+    hash = bcrypt.hashpw(bytes_pass, bcrypt.gensalt(rounds or get_rounds()))
 
     return hash
 
@@ -17,3 +77,179 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     '''check if a hashed password is valid'''
 
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    '''the work factor stored in a `$2b$<rounds>$...` hash'''
+    return int(hashed_password.split(b'$')[2])
+
+
+def needs_rehash(hashed_password: bytes, rounds: int = None) -> bool:
+    '''check if a hash was made with another work factor than the current'''
+    return hash_rounds(hashed_password) != (rounds or get_rounds())
+
+
+def verify_and_rehash(hashed_password: bytes,
+                      password: str) -> Tuple[bool, Optional[bytes]]:
+    '''
+    check a password and upgrade its hash when the work factor changed
+    Return:
+        - (False, None): if the password is not valid
+        - (True, None): if the password is valid and the hash up to date
+        - (True, new_hash): if the hash should be replaced by new_hash
+    '''
+    if not is_valid(hashed_password, password):
+        return False, None
+    if needs_rehash(hashed_password):
+        return True, hash_password(password)
+    return True, None
+
+
+def _mp_context():
+    '''
+    the start method of the worker processes: fork, the forkserver and
+    spawn workers import the main script again (and re-run its side
+    effects), so the pool is started by HashingService.start() before
+    the process runs threads; spawn only where fork is not available
+    '''
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+
+def _noop() -> None:
+    '''the operation starting the workers'''
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    '''hash a password, runs in a worker process'''
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    '''check a password, runs in a worker process'''
+    return bcrypt.checkpw(password, hashed_password)
+
+
+# HashingService is kept identical in 0x00-personal_data/encrypt_password.py
+# and 0x03-user_authentication_service/hashing.py, the projects are
+# standalone directories that can't import each other
+class HashingService:
+    '''
+    runs bcrypt in a pool of worker processes so the calling threads
+    (or event loop) are not blocked for the whole hashing time,
+    at most max_pending operations are queued, callers beyond that wait
+    for a free slot (backpressure) and fail with queue.Full on timeout
+    '''
+
+    def __init__(self, workers: int = None, max_pending: int = 64):
+        '''initializing the instance'''
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.waited = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        '''the process pool, started on first use'''
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=_mp_context())
+            return self._executor
+
+    def start(self) -> None:
+        '''
+        start the worker processes now, to call at startup before the
+        process runs threads (a web server) since they are forked,
+        the first operation starts them otherwise
+        '''
+        self.executor.submit(_noop).result()
+
+    def _acquire(self, timeout: float = None) -> None:
+        '''wait for a free slot in the queue'''
+        if self._slots.acquire(blocking=False):
+            return
+        with self._lock:
+            self.waited += 1
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.rejected += 1
+            raise Full('too many pending hashing operations')
+
+    def _done(self, future: Future) -> None:
+        '''free the slot of a finished operation'''
+        self._slots.release()
+        with self._lock:
+            self.completed += 1
+
+    def _submit(self, fn, *args) -> Future:
+        '''submit an operation, a slot must have been acquired'''
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.submitted += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def submit_hash(self, password: str, timeout: float = None) -> Future:
+        '''queue the hashing of a password, the future holds the hash'''
+        self._acquire(timeout)
+        return self._submit(_hashpw, password.encode(), get_rounds())
+
+    def submit_check(self, hashed_password: bytes, password: str,
+                     timeout: float = None) -> Future:
+        '''queue a password check, the future holds the result'''
+        self._acquire(timeout)
+        return self._submit(_checkpw, password.encode(), hashed_password)
+
+    def hash_password(self, password: str, timeout: float = None) -> bytes:
+        '''hashing the password in a worker process'''
+        return self.submit_hash(password, timeout).result()
+
+    def is_valid(self, hashed_password: bytes, password: str,
+                 timeout: float = None) -> bool:
+        '''check if a hashed password is valid in a worker process'''
+        return self.submit_check(hashed_password, password, timeout).result()
+
+    async def hash_password_async(self, password: str,
+                                  timeout: float = None) -> bytes:
+        '''hashing the password without blocking the event loop'''
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(
+            None, self.submit_hash, password, timeout)
+        return await asyncio.wrap_future(future)
+
+    async def is_valid_async(self, hashed_password: bytes, password: str,
+                             timeout: float = None) -> bool:
+        '''check a password without blocking the event loop'''
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(
+            None, self.submit_check, hashed_password, password, timeout)
+        return await asyncio.wrap_future(future)
+
+    def metrics(self) -> dict:
+        '''the backpressure counters of the service'''
+        with self._lock:
+            return {
+                'pending': self.submitted - self.completed,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'waited': self.waited,
+                'rejected': self.rejected,
+            }
+
+    def close(self) -> None:
+        '''wait for the pending operations and stop the workers'''
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -2,24 +2,58 @@
 '''Regex-ing'''
 
 
+import argparse
+import atexit
+import json
 import logging
+import logging.handlers
 import os
 import mysql.connector
 import re
-from typing import List
+import shutil
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import repeat
+from queue import Empty, Full, Queue
+from typing import (Any, Callable, Collection, Iterator, List, Mapping,
+                    Sequence, Tuple)
 
 
 PII_FIELDS = ('name', 'email', 'phone',
               'ssn', 'password',)
 
 
+@lru_cache(maxsize=128)
+def _redactor(fields: Tuple[str, ...], redaction: str,
+              separator: str) -> Callable[[str], str]:
+    '''
+    compile all the fields into a single alternation pattern,
+    the result is cached per (fields, redaction, separator)
+    Return:
+        - a function redacting every field of a message in one pass
+    '''
+    # longest names first so a field is never shadowed by its own prefix
+    names = sorted(set(fields), key=len, reverse=True)
+    alternation = '|'.join(re.escape(name) for name in names)
+    pattern = re.compile(
+        fr'({alternation})=[^{re.escape(separator)}]+')
+    replacement = f'\\1={redaction}'
+
+    def redact(message: str) -> str:
+        return pattern.sub(replacement, message)
+
+    return redact
+
+
 def filter_datum(fields: List[str], redaction: str,
                  message: str, separator: str) -> str:
     '''returns the log message obfuscated:'''
-    for field in fields:
-        message = re.sub(fr'({field})=([^{separator}]+)',
-                         f'\\1={redaction}', message)
-    return message
+    if not fields:
+        return message
+    return _redactor(tuple(fields), redaction, separator)(message)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -34,28 +68,171 @@ class RedactingFormatter(logging.Formatter):
         '''initializing the instance'''
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.hits = 0
+        self.misses = 0
+
+    def contains_pii(self, message: str) -> bool:
+        '''check if any of the fields appears as a `key=` in the message'''
+        return any(f'{field}=' in message for field in self.fields)
+
+    def hit_ratio(self) -> float:
+        '''the share of formatted records that needed redaction'''
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
 
     def format(self, record: logging.LogRecord) -> str:
         '''formatting record'''
+        message = record.getMessage()
+        if getattr(record, 'redacted', False) or \
+                not self.contains_pii(message):
+            # nothing to redact, skip the regex work entirely
+            self.misses += 1
+            return super().format(record)
+
+        self.hits += 1
         log = filter_datum(
-            self.fields, self.REDACTION, record.getMessage(), self.SEPARATOR)
+            self.fields, self.REDACTION, message, self.SEPARATOR)
         record.msg = log
+        # the arguments are already merged into the redacted message
+        record.args = None
         return super().format(record)
 
 
-def get_logger() -> logging.Logger:
+class BatchingStreamHandler(logging.StreamHandler):
+    '''
+    stream handler that buffers the formatted records and writes them
+    in one call, either when the batch is full or the queue is drained
+    '''
+
+    def __init__(self, queue: Queue, batch_size: int = 100, stream=None):
+        '''initializing the instance'''
+        super().__init__(stream)
+        self.queue = queue
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        '''add the formatted record to the current batch'''
+        try:
+            self.buffer.append(self.format(record) + self.terminator)
+            if len(self.buffer) >= self.batch_size or self.queue.empty():
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        '''write the pending batch to the stream'''
+        self.acquire()
+        try:
+            if self.buffer and self.stream:
+                self.stream.write(''.join(self.buffer))
+                self.buffer = []
+            super().flush()
+        finally:
+            self.release()
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    '''
+    queue handler for a bounded queue, when the queue is full the record
+    is either dropped or the caller blocks until there is room
+    '''
+
+    POLICIES = ('block', 'drop',)
+
+    def __init__(self, queue: Queue, policy: str = 'block'):
+        '''initializing the instance'''
+        if policy not in self.POLICIES:
+            raise ValueError(f'unknown queue policy: {policy}')
+        super().__init__(queue)
+        self.policy = policy
+        self.dropped = 0
+        self.listener = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        '''leave the formatting (and redaction) to the listener thread'''
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        '''put the record in the queue according to the policy'''
+        if self.policy == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class RedactingQueueListener(logging.handlers.QueueListener):
+    '''queue listener that can be stopped even when the queue is full'''
+
+    def enqueue_sentinel(self) -> None:
+        '''wait for room in the queue instead of raising Full'''
+        self.queue.put(self._sentinel)
+
+
+def _stop_listener(listener: RedactingQueueListener) -> None:
+    '''drain the queue and flush the pending batches on shutdown'''
+    if listener._thread is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.flush()
+
+
+def get_logger(queued: bool = False, queue_size: int = 10000,
+               policy: str = 'block',
+               batch_size: int = 100) -> logging.Logger:
     '''
     the use of this function is to create a logging object
     and add to it our custom formatter
+    parameters:
+        - queued: when True, redaction and writes happen on a
+          background listener thread fed by a bounded queue
+        - queue_size: the maximum number of pending records
+        - policy: 'block' or 'drop' when the queue is full
+        - batch_size: the maximum number of records per write
     '''
     logger = logging.getLogger("user_data")
     logger.setLevel(logging.INFO)
     logger.propagate = False
-    stream_handler = logging.StreamHandler()
     redacting_formatter = RedactingFormatter(PII_FIELDS)
+
+    if not queued:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(redacting_formatter)
+        logger.addHandler(stream_handler)
+        return logger
+
+    records = Queue(maxsize=queue_size)
+    queue_handler = BoundedQueueHandler(records, policy)
+    stream_handler = BatchingStreamHandler(records, batch_size)
     stream_handler.setFormatter(redacting_formatter)
-    logger.addHandler(stream_handler)
 
+    listener = RedactingQueueListener(records, stream_handler)
+    queue_handler.listener = listener
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    logger.addHandler(queue_handler)
+
+    return logger
+
+
+def get_json_logger() -> logging.Logger:
+    '''
+    a logger writing the bare messages to stderr, one JSON document per
+    line (JSON Lines), for the rows already masked by redact_row
+    '''
+    logger = logging.getLogger("user_data.json")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(stream_handler)
     return logger
 
 
@@ -74,25 +251,402 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return connection
 
 
-def main() -> None:
-    '''main function'''
+class ConnectionPool:
+    '''
+    a bounded pool of reusable database connections,
+    connections are opened lazily up to `size` and checked
+    with a `SELECT 1` before being handed out again
+    '''
+
+    def __init__(self, size: int = 5, connect: Callable = get_db,
+                 health_check: bool = True):
+        '''
+        initializing the instance
+        parameters:
+            - size: the maximum number of open connections
+            - connect: the function opening a new connection
+            - health_check: ping idle connections before reusing them
+        '''
+        if size < 1:
+            raise ValueError('the pool size must be at least 1')
+        self.size = size
+        self.connect = connect
+        self.health_check = health_check
+        self._idle = Queue(maxsize=size)
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_healthy(connection) -> bool:
+        '''check if a connection can still run a query'''
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def _open(self):
+        '''open a new connection counted against the pool size'''
+        try:
+            return self.connect()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def acquire(self, timeout: float = None):
+        '''
+        get a connection from the pool, opening one if the pool is not
+        full yet, otherwise wait for a connection to be released
+        Return:
+            - a connection
+        Raise:
+            - queue.Empty: if no connection was released before timeout
+        '''
+        try:
+            connection = self._idle.get_nowait()
+        except Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                return self._open()
+            connection = self._idle.get(timeout=timeout)
+
+        if self.health_check and not self.is_healthy(connection):
+            try:
+                connection.close()
+            except Exception:
+                pass
+            return self._open()
+        return connection
+
+    def release(self, connection) -> None:
+        '''
+        give a connection back to the pool, its transaction is rolled
+        back first so the next caller doesn't get its snapshot
+        (autocommit is off); a connection failing that is closed
+        '''
+        try:
+            connection.rollback()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            try:
+                connection.close()
+            except Exception:
+                pass
+            return
+        self._idle.put_nowait(connection)
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        '''acquire a connection for the duration of a `with` block'''
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self) -> None:
+        '''close all the idle connections'''
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except Empty:
+                return
+            with self._lock:
+                self._opened -= 1
+            connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
 
-    logger = get_logger()
-    db = get_db()
 
-    with db.cursor() as cursor:
-        cursor.execute('SELECT * FROM users;')
+def get_pool() -> ConnectionPool:
+    '''
+    returns the connection pool shared by all the callers,
+    its size is read from PERSONAL_DATA_DB_POOL_SIZE (default 5)
+    '''
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            size = int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE', '5'))
+            _pool = ConnectionPool(size)
+            atexit.register(_pool.close)
+    return _pool
+
+
+def iter_rows(cursor, batch_size: int = 1000) -> Iterator[tuple]:
+    '''
+    yields the rows of an executed cursor,
+    fetching them from the server batch_size rows at a time
+    '''
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def format_row(fields: Sequence[str], row: Sequence) -> str:
+    '''format a row as a `field=value;` log message'''
+    msg = ''.join(
+        f'{field}={str(value)}; '
+        for field, value in zip(fields, row)
+    )
+    return msg.strip()
+
+
+def redact_row(row: Mapping[str, Any], fields: Collection[str] = PII_FIELDS,
+               redaction: str = RedactingFormatter.REDACTION) -> dict:
+    '''returns a copy of the row with the PII columns masked by name'''
+    fields = frozenset(fields)
+    return {
+        column: redaction if column in fields else value
+        for column, value in row.items()
+    }
+
+
+def serialize_row(row: Mapping[str, Any],
+                  output_format: str = 'legacy') -> str:
+    '''
+    serialize a row either as the legacy `field=value;` message
+    or as a JSON line
+    '''
+    if output_format == 'json':
+        return json.dumps(row, default=str)
+    if output_format == 'legacy':
+        return format_row(list(row.keys()), list(row.values()))
+    raise ValueError(f'unknown output format: {output_format}')
+
+
+def export_users(db, logger: logging.Logger, batch_size: int = 1000,
+                 progress: Callable[[int], None] = None,
+                 key_range: Tuple[int, int] = None, key: str = 'id',
+                 output_format: str = None) -> int:
+    '''
+    log every row of the users table without loading the whole table,
+    an unbuffered cursor streams the rows from the server in batches
+    parameters:
+        - db: the database connection
+        - logger: the logger receiving one record per row
+        - batch_size: the number of rows fetched at a time
+        - progress: called with the number of rows exported so far,
+          after every batch
+        - key_range: only export the rows with low <= key < high
+        - key: the numeric primary key column used by key_range
+        - output_format: None lets the formatter redact the messages,
+          'legacy' or 'json' mask the PII columns by name before
+          serialization and bypass the formatter regex
+    Return:
+        - the number of exported rows
+    '''
+    query, params = 'SELECT * FROM users;', ()
+    if key_range is not None:
+        if not key.isidentifier():
+            raise ValueError(f'invalid key column: {key}')
+        query = (f'SELECT * FROM users WHERE {key} >= %s AND {key} < %s '
+                 f'ORDER BY {key};')
+        params = key_range
+
+    count = 0
+    with db.cursor(buffered=False) as cursor:
+        cursor.execute(query, params)
         fields = [field[0] for field in cursor.description]
-        rows = cursor.fetchall()
-        for row in rows:
-            msg = ''.join(
-                f'{field}={str(value)}; '
-                for field, value in zip(fields, row)
-            )
-            logger.info(msg.strip())
+        pii = frozenset(fields).intersection(PII_FIELDS)
+        for row in iter_rows(cursor, batch_size):
+            if output_format is None:
+                logger.info(format_row(fields, row))
+            else:
+                record = redact_row(dict(zip(fields, row)), pii)
+                logger.info(serialize_row(record, output_format),
+                            extra={'redacted': True})
+            count += 1
+            if progress and count % batch_size == 0:
+                progress(count)
+
+    if progress and count % batch_size != 0:
+        progress(count)
+    return count
+
+
+def report_progress(count: int) -> None:
+    '''print the export progress to stderr'''
+    print(f'exported {count} rows', file=sys.stderr)
+
+
+def shard_ranges(low: int, high: int, shards: int) -> List[Tuple[int, int]]:
+    '''
+    split [low, high) into at most `shards` contiguous ranges
+    of (almost) the same size
+    '''
+    shards = max(1, min(shards, high - low))
+    size, extra = divmod(high - low, shards)
+    ranges = []
+    start = low
+    for index in range(shards):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _export_shard(key_range: Tuple[int, int], file_path: str,
+                  key: str, batch_size: int, output_format: str) -> int:
+    '''
+    export one key range to its own file, runs in a worker process
+    with its own connection and redacting formatter (bare JSON lines
+    for the json output format)
+    '''
+    logger = logging.getLogger('user_data.export')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    file_handler = logging.FileHandler(file_path, mode='w')
+    if output_format == 'json':
+        file_handler.setFormatter(logging.Formatter('%(message)s'))
+    else:
+        file_handler.setFormatter(RedactingFormatter(PII_FIELDS))
+    logger.addHandler(file_handler)
+
+    db = get_db()
+    try:
+        return export_users(db, logger, batch_size,
+                            key_range=key_range, key=key,
+                            output_format=output_format)
+    finally:
+        db.close()
+        logger.removeHandler(file_handler)
+        file_handler.close()
+
+
+def export_sharded(shards: int = None, key: str = 'id',
+                   output_dir: str = '.', merge: bool = True,
+                   batch_size: int = 1000,
+                   output_format: str = None) -> int:
+    '''
+    export the users table in parallel, the table is split in ranges
+    of its numeric primary key and each range is exported by a worker
+    process into `users.<shard>.log`
+    parameters:
+        - shards: the number of ranges (defaults to the number of CPUs)
+        - key: the numeric primary key column
+        - output_dir: the directory of the per-shard files
+        - merge: when True, the files are written to stderr in key
+          order and removed, otherwise they are kept
+        - batch_size: the number of rows fetched at a time
+        - output_format: see export_users
+    Return:
+        - the number of exported rows
+    '''
+    if not key.isidentifier():
+        raise ValueError(f'invalid key column: {key}')
+    shards = shards or os.cpu_count() or 1
+
+    db = get_db()
+    try:
+        with db.cursor() as cursor:
+            cursor.execute('SELECT * FROM users LIMIT 0;')
+            cursor.fetchall()
+            columns = [field[0] for field in cursor.description]
+            if key not in columns:
+                raise ValueError(
+                    f'the users table has no {key} column to shard on, '
+                    f'pick an integer column with --key (columns: '
+                    f'{", ".join(columns)})')
+            cursor.execute(f'SELECT MIN({key}), MAX({key}) FROM users;')
+            low, high = cursor.fetchone()
+    finally:
+        db.close()
+    if low is None:
+        return 0
+    if not isinstance(low, int) or not isinstance(high, int):
+        raise ValueError(f'the shard key {key} must be an integer column')
+
+    ranges = shard_ranges(low, high + 1, shards)
+    paths = [os.path.join(output_dir, f'users.{index}.log')
+             for index in range(len(ranges))]
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        counts = list(pool.map(_export_shard, ranges, paths,
+                               repeat(key), repeat(batch_size),
+                               repeat(output_format)))
+
+    if merge:
+        for file_path in paths:
+            with open(file_path, 'r') as f:
+                shutil.copyfileobj(f, sys.stderr)
+            os.remove(file_path)
+
+    return sum(counts)
+
+
+def main(batch_size: int = 1000,
+         progress: Callable[[int], None] = None,
+         shards: int = 1, output_format: str = None,
+         key: str = 'id') -> None:
+    '''main function'''
+
+    if shards > 1:
+        export_sharded(shards, key, batch_size=batch_size,
+                       output_format=output_format)
+        return
+
+    if output_format == 'json':
+        logger = get_json_logger()
+    else:
+        logger = get_logger()
+    with get_pool().connection() as db:
+        export_users(db, logger, batch_size, progress,
+                     output_format=output_format)
+
+
+def parse_args(argv: Sequence[str] = None) -> dict:
+    '''
+    read the export options from the command line
+    Return:
+        - the keyword arguments of main
+    '''
+    parser = argparse.ArgumentParser(
+        description='log the users table with the PII fields redacted')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='number of rows fetched at a time')
+    parser.add_argument('--progress', action='store_true',
+                        help='report the exported rows on stderr '
+                             '(single process export only)')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument('--key', default='id',
+                        help='integer column splitting the table between '
+                             'the shards (default: id)')
+    parser.add_argument('--format', dest='output_format',
+                        choices=('legacy', 'json'), default=None,
+                        help='mask the PII columns by name and write '
+                             'legacy or JSON lines')
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+    if args.shards < 1:
+        parser.error('--shards must be at least 1')
 
-    db.close()
+    return {
+        'batch_size': args.batch_size,
+        'progress': report_progress if args.progress else None,
+        'shards': args.shards,
+        'output_format': args.output_format,
+        'key': args.key,
+    }
 
 
 if __name__ == '__main__':
-    main()
+    try:
+        main(**parse_args())
+    except ValueError as e:
+        sys.exit(f'error: {e}')
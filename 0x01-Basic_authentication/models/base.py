@@ -10,12 +10,19 @@ import uuid
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+# INDEXES[class][attribute][value] = {id: None} (ordered set of ids)
+INDEXES = {}
+# indexed values of each saved object: _INDEXED[class][id][attribute]
+_INDEXED = {}
 
 
 class Base():
     """ Base class
     """
 
+    # attributes with a secondary index, for hash lookups in search()
+    __indexes__ = ()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
@@ -71,6 +78,7 @@ class Base():
             objs_json = json.load(f)
             for obj_id, obj_json in objs_json.items():
                 DATA[s_class][obj_id] = cls(**obj_json)
+        cls._rebuild_indexes()
 
     @classmethod
     def save_to_file(cls):
@@ -91,6 +99,7 @@ class Base():
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
         DATA[s_class][self.id] = self
+        self.__class__._index(self)
         self.__class__.save_to_file()
 
     def remove(self):
@@ -99,8 +108,52 @@ class Base():
         s_class = self.__class__.__name__
         if DATA[s_class].get(self.id) is not None:
             del DATA[s_class][self.id]
+            self.__class__._unindex(self.id)
             self.__class__.save_to_file()
 
+    @classmethod
+    def _unindex(cls, obj_id: str):
+        """ Remove an object from the secondary indexes
+        """
+        s_class = cls.__name__
+        indexes = INDEXES.setdefault(s_class, {})
+        values = _INDEXED.setdefault(s_class, {}).pop(obj_id, {})
+        for attr, value in values.items():
+            ids = indexes[attr].get(value)
+            if ids is not None:
+                ids.pop(obj_id, None)
+                if len(ids) == 0:
+                    del indexes[attr][value]
+
+    @classmethod
+    def _index(cls, obj: TypeVar('Base')):
+        """ Add (or move) an object in the secondary indexes
+        """
+        s_class = cls.__name__
+        cls._unindex(obj.id)
+        indexes = INDEXES.setdefault(s_class, {})
+        values = {}
+        for attr in cls.__indexes__:
+            value = getattr(obj, attr, None)
+            try:
+                ids = indexes.setdefault(attr, {}).setdefault(value, {})
+            except TypeError:
+                # unhashable values are only found by a full scan
+                continue
+            ids[obj.id] = None
+            values[attr] = value
+        _INDEXED[s_class][obj.id] = values
+
+    @classmethod
+    def _rebuild_indexes(cls):
+        """ Index all the objects of the class
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {attr: {} for attr in cls.__indexes__}
+        _INDEXED[s_class] = {}
+        for obj in DATA[s_class].values():
+            cls._index(obj)
+
     @classmethod
     def count(cls) -> int:
         """ Count all objects
@@ -126,6 +179,7 @@ class Base():
         """ Search all objects with matching attributes
         """
         s_class = cls.__name__
+        objs = DATA[s_class]
 
         def _search(obj):
             if len(attributes) == 0:
@@ -135,4 +189,15 @@ class Base():
                     return False
             return True
 
-        return list(filter(_search, DATA[s_class].values()))
+        candidates = objs.values()
+        for k, v in attributes.items():
+            if k not in cls.__indexes__:
+                continue
+            try:
+                ids = INDEXES.get(s_class, {}).get(k, {}).get(v, {})
+            except TypeError:
+                continue
+            candidates = [objs[obj_id] for obj_id in ids if obj_id in objs]
+            break
+
+        return list(filter(_search, candidates))
@@ -9,7 +9,7 @@ from api.v1.auth.session_auth import SessionAuth
 from api.v1.auth.session_db_auth import SessionDBAuth
 from api.v1.auth.session_exp_auth import SessionExpAuth
 from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
+from flask import Flask, current_app, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
 import os
 
@@ -18,6 +18,16 @@ app = Flask(__name__)
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 auth = None
+# paths without authentication, a trailing '*' matches any suffix;
+# AUTH_EXCLUDED_PATHS (comma separated) replaces them, the list is
+# compiled once per value by Auth.require_auth
+app.config['AUTH_EXCLUDED_PATHS'] = ['/api/v1/status/',
+                                     '/api/v1/unauthorized/',
+                                     '/api/v1/forbidden/',
+                                     '/api/v1/auth_session/login/']
+if os.getenv("AUTH_EXCLUDED_PATHS"):
+    app.config['AUTH_EXCLUDED_PATHS'] = \
+        os.getenv("AUTH_EXCLUDED_PATHS").split(',')
 
 
 if os.getenv("AUTH_TYPE", None) is not None:
@@ -39,22 +49,16 @@ if os.getenv("AUTH_TYPE", None) is not None:
 def before_request():
     '''execute before any request'''
     if auth:
-        path = request.path
-        excluded_paths = ['/api/v1/status/',
-                          '/api/v1/unauthorized/',
-                          '/api/v1/forbidden/',
-                          '/api/v1/auth_session/login/']
-
-        if auth.require_auth(path, excluded_paths):
+        if auth.require_auth(request.path,
+                             current_app.config['AUTH_EXCLUDED_PATHS']):
             if auth.authorization_header(request) is None and \
                     auth.session_cookie(request) is None:
                 abort(401)
 
-            if auth.current_user(request) is None:
+            request.current_user = auth.resolve_current_user(request)
+            if request.current_user is None:
                 abort(403)
 
-            request.current_user = auth.current_user(request)
-
 
 @app.errorhandler(404)
 def not_found(error) -> str:
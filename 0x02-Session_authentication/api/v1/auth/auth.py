@@ -3,15 +3,33 @@
 
 
 import os
-from typing import List, TypeVar
+from functools import lru_cache
+from typing import List, TypeVar, Union
 from flask import request
+from api.v1.auth.path_matcher import PathMatcher
+
+
+# WSGI environ key of the resolved user of a request
+_CURRENT_USER_KEY = 'api.auth.current_user'
+
+
+@lru_cache(maxsize=32)
+def _compile(excluded_paths: tuple) -> PathMatcher:
+    '''the matcher of a list of excluded paths'''
+    return PathMatcher(excluded_paths)
 
 
 class Auth:
     '''class to manage the API authentication.'''
 
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    # True when current_user() does real work (a lookup, a search or a
+    # password hash), its result is then kept for the rest of the request
+    memoize_current_user = False
+
+    def require_auth(self, path: str,
+                     excluded_paths: Union[List[str], PathMatcher]) -> bool:
         '''check if a path requires authentication
+        excluded_paths is a list of paths (compiled once) or a PathMatcher
         Return:
             - True: if path require authentication
             - False: if path does not require authentication
@@ -21,20 +39,9 @@ class Auth:
         if excluded_paths is None or excluded_paths == []:
             return True
 
-        if path[-1] != '/':
-            path += '/'
-
-        for excluded_path in excluded_paths:
-
-            if excluded_path.find('*') != -1:
-                index = excluded_path.find('*')
-                if path[:index] == excluded_path[:index]:
-                    return False
-
-            elif path == excluded_path:
-                return False
-
-        return True
+        if not isinstance(excluded_paths, PathMatcher):
+            excluded_paths = _compile(tuple(excluded_paths))
+        return not excluded_paths.match(path)
 
     def authorization_header(self, request=None) -> str:
         '''return the value of the authorization header'''
@@ -50,6 +57,20 @@ class Auth:
         '''
         return None
 
+    def resolve_current_user(self, request=None) -> TypeVar('User'):
+        '''
+        the current user of the request being handled, current_user is
+        only called the first time and the result kept in the WSGI
+        environ of the request (flask.g can outlive a request)
+        '''
+        environ = getattr(request, 'environ', None)
+        if not self.memoize_current_user or environ is None:
+            return self.current_user(request)
+
+        if _CURRENT_USER_KEY not in environ:
+            environ[_CURRENT_USER_KEY] = self.current_user(request)
+        return environ[_CURRENT_USER_KEY]
+
     def session_cookie(self, request=None):
         '''returns a cookie value from a request'''
         if request is None:
@@ -3,14 +3,40 @@
 
 
 import base64
+import os
 from typing import TypeVar
 from api.v1.auth.auth import Auth
+from api.v1.auth.credential_cache import CredentialCache
 from models.user import User
 
 
 class BasicAuth(Auth):
     '''Implementing basic authentication'''
 
+    # decoding, search and password hash (unless cached)
+    memoize_current_user = True
+
+    def __init__(self):
+        '''
+        Initializing the instance, the verified credentials are cached
+        for BASIC_AUTH_CACHE_TTL seconds (60 by default, 0 to disable),
+        at most BASIC_AUTH_CACHE_SIZE of them (1024 by default)
+        '''
+        self.credential_cache = CredentialCache(
+            int(os.getenv('BASIC_AUTH_CACHE_SIZE', '1024')),
+            float(os.getenv('BASIC_AUTH_CACHE_TTL', '60')))
+        # password changes and deletions drop the cached credentials,
+        # the changes made by other processes are caught by the version
+        User.add_listener(self.credential_cache.invalidate)
+
+    @staticmethod
+    def credentials_version(user: User) -> tuple:
+        '''
+        the credentials a cached Authorization header was verified
+        against, a cache hit is only valid while they are the same
+        '''
+        return (user.email, user._password)
+
     def extract_base64_authorization_header(
             self, authorization_header: str) -> str:
         '''
@@ -86,6 +112,14 @@ class BasicAuth(Auth):
         user = None
 
         authorization = self.authorization_header(request)
+        cached = self.credential_cache.get(authorization)
+        if cached is not None:
+            user = User.get(cached[0])
+            if user is not None and \
+                    self.credentials_version(user) == cached[1]:
+                return user
+            self.credential_cache.discard(authorization)
+            user = None
 
         base64_authorization = \
             self.extract_base64_authorization_header(authorization)
@@ -97,5 +131,8 @@ class BasicAuth(Auth):
         if credentials:
             user = self.user_object_from_credentials(
                 credentials[0], credentials[1])
+        if user is not None:
+            self.credential_cache.set(authorization, user.id,
+                                      self.credentials_version(user))
 
         return user
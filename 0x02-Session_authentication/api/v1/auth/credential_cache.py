@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+'''Cache of verified credentials Module'''
+
+
+from collections import OrderedDict
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+
+class CredentialCache:
+    '''
+    bounded cache mapping an Authorization header, whose credentials
+    were verified, to the user id and the version of the user (the
+    credentials it was verified against) for ttl seconds.
+    the headers are only kept as a keyed hash (HMAC-SHA256 with a secret
+    of the process), never in clear
+    '''
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        '''Initializing the instance'''
+        self.max_size = max_size
+        self.ttl = ttl
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def _key(self, authorization: str) -> bytes:
+        '''the keyed hash of an Authorization header'''
+        return hmac.new(self._secret, authorization.encode(),
+                        hashlib.sha256).digest()
+
+    def get(self, authorization: str) -> tuple:
+        '''
+        Return:
+            - (user id, version) of a cached Authorization header
+            - None if not cached (or expired)
+        '''
+        if not authorization or self.ttl <= 0 or self.max_size <= 0:
+            return None
+        key = self._key(authorization)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user_id, version, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return user_id, version
+
+    def set(self, authorization: str, user_id: str, version=None) -> None:
+        '''cache the user id (and version) of verified credentials'''
+        if not authorization or self.ttl <= 0 or self.max_size <= 0:
+            return
+        key = self._key(authorization)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (user_id, version,
+                                  time.monotonic() + self.ttl)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: bytes) -> None:
+        '''drop an entry, the lock must be held'''
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry[0]]
+
+    def discard(self, authorization: str) -> None:
+        '''drop the entry of an Authorization header'''
+        if not authorization:
+            return
+        key = self._key(authorization)
+        with self._lock:
+            self._remove(key)
+
+    def invalidate(self, user) -> None:
+        '''drop the entries of a user (saved or removed)'''
+        with self._lock:
+            for key in list(self._keys_by_user.get(user.id, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        '''drop all the entries'''
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+'''Excluded paths matcher Module'''
+
+
+from typing import Iterable
+
+
+# key of the trie nodes ending a wildcard prefix
+_END = ''
+
+
+class PathMatcher:
+    '''
+    excluded paths compiled once for Auth.require_auth:
+        - the paths without '*' in a set, matched exactly
+        - the paths with a '*' in a prefix trie, the path matches
+          if it starts with the part before the first '*'
+    the matched path gets a trailing '/' first
+    '''
+
+    def __init__(self, excluded_paths: Iterable[str] = ()):
+        '''compiling the excluded paths'''
+        self.excluded_paths = tuple(excluded_paths)
+        self.exact = set()
+        self._trie = {}
+        for excluded_path in self.excluded_paths:
+            index = excluded_path.find('*')
+            if index == -1:
+                self.exact.add(excluded_path)
+                continue
+            node = self._trie
+            for char in excluded_path[:index]:
+                node = node.setdefault(char, {})
+            node[_END] = True
+
+    def match(self, path: str) -> bool:
+        '''
+        Return:
+            - True: if path is excluded
+            - False: otherwise
+        '''
+        if path[-1:] != '/':
+            path += '/'
+        if path in self.exact:
+            return True
+
+        node = self._trie
+        if _END in node:
+            return True
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
@@ -2,15 +2,23 @@
 '''session Module'''
 
 
+import os
 import uuid
 from api.v1.auth.auth import Auth
+from api.v1.auth.session_store import SessionStore
 from models.user import User
 
 
 class SessionAuth(Auth):
     '''Implementing the Session authentication'''
 
-    user_id_by_session_id = {}
+    # shared by all instances, at most SESSION_STORE_MAX_SIZE sessions
+    # in SESSION_STORE_SHARDS shards
+    user_id_by_session_id = SessionStore(
+        int(os.getenv('SESSION_STORE_MAX_SIZE', '100000')),
+        int(os.getenv('SESSION_STORE_SHARDS', '16')))
+    # dictionary lookup and User.get (SessionDBAuth reloads the store)
+    memoize_current_user = True
 
     def create_session(self, user_id: str = None) -> str:
         '''creates a Session ID for a user_id'''
@@ -49,5 +57,5 @@ class SessionAuth(Auth):
         if self.user_id_for_session_id(session_id) is None:
             return False
 
-        self.user_id_by_session_id.pop(session_id)
+        self.user_id_by_session_id.pop(session_id, None)
         return True
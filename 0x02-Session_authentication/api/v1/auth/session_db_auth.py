@@ -65,6 +65,7 @@ class SessionDBAuth(SessionExpAuth):
             users_sessions = self.user_session.search(
                 {'session_id': session_id})
 
+            self.user_id_by_session_id.pop(session_id, None)
             if users_sessions != []:
                 user_session = users_sessions[0]
                 user_session.remove()
@@ -3,15 +3,28 @@
 
 
 from datetime import datetime, timedelta
+import heapq
 import os
+import threading
+import time
 from api.v1.auth.session_auth import SessionAuth
 
 
+# number of expired sessions reaped by each create / lookup
+REAP_BATCH = 100
+
+
 class SessionExpAuth(SessionAuth):
     '''class to implement expiration date for session id'''
 
     def __init__(self):
-        '''Initializing the instance'''
+        '''
+        Initializing the instance
+        the sessions are indexed by expiration date (a heap) and removed
+        once expired, REAP_BATCH at a time by create_session and
+        user_id_for_session_id, and every SESSION_REAP_INTERVAL seconds
+        by a background thread if set
+        '''
         self.session_duration = 0
 
         try:
@@ -21,6 +34,20 @@ class SessionExpAuth(SessionAuth):
         except ValueError:
             pass
 
+        self.expired = 0
+        self._expirations = []
+        self._expirations_lock = threading.Lock()
+
+        reap_interval = 0
+        try:
+            reap_interval = float(os.getenv('SESSION_REAP_INTERVAL', '0'))
+        except ValueError:
+            pass
+        if self.session_duration > 0 and reap_interval > 0:
+            reaper = threading.Thread(target=self._reaper,
+                                      args=(reap_interval,), daemon=True)
+            reaper.start()
+
     def create_session(self, user_id=None):
         '''
         create a session instance
@@ -32,17 +59,27 @@ class SessionExpAuth(SessionAuth):
         if session_id is None:
             return None
 
+        self.reap_expired_sessions(REAP_BATCH)
         session_dictionary = {
             "user_id": user_id, "created_at": datetime.now()
         }
         self.user_id_by_session_id[session_id] = session_dictionary
 
+        if self.session_duration > 0:
+            expiration = session_dictionary['created_at'] + \
+                timedelta(seconds=self.session_duration)
+            with self._expirations_lock:
+                heapq.heappush(self._expirations,
+                               (expiration, session_id,
+                                session_dictionary['created_at']))
+
         return session_id
 
     def user_id_for_session_id(self, session_id=None):
         '''get the user for the session id'''
         if session_id is None:
             return None
+        self.reap_expired_sessions(REAP_BATCH)
         session_dict = self.user_id_by_session_id.get(session_id, None)
         if session_dict is None:
             return None
@@ -56,6 +93,68 @@ class SessionExpAuth(SessionAuth):
 
         expiration = created_at + timedelta(seconds=self.session_duration)
         if expiration < datetime.now():  # if expiration date is passed
+            if self.user_id_by_session_id.pop_if(
+                    session_id, lambda value: value is session_dict):
+                self._count_expired(1)
             return None
 
         return session_dict.get('user_id')
+
+    def reap_expired_sessions(self, limit: int = None) -> int:
+        '''
+        remove the expired sessions from the store, at most limit of
+        the expiration index entries are processed
+        Return:
+            - the number of sessions removed
+        '''
+        now = datetime.now()
+        processed = 0
+        reaped = 0
+        while limit is None or processed < limit:
+            with self._expirations_lock:
+                if not self._expirations or self._expirations[0][0] > now:
+                    break
+                _, session_id, created_at = heapq.heappop(self._expirations)
+            processed += 1
+
+            # skip a session created again with the same id, and drop
+            # the user ids cached by SessionDBAuth
+            def is_expired(value):
+                return not isinstance(value, dict) or \
+                    value.get('created_at') == created_at
+
+            if self.user_id_by_session_id.pop_if(session_id, is_expired):
+                reaped += 1
+        self._count_expired(reaped)
+        return reaped
+
+    def _count_expired(self, count: int) -> None:
+        '''add to the number of expired sessions removed'''
+        if count:
+            with self._expirations_lock:
+                self.expired += count
+
+    def _reaper(self, interval: float) -> None:
+        '''remove the expired sessions every interval seconds'''
+        while True:
+            time.sleep(interval)
+            self.reap_expired_sessions()
+
+    def session_metrics(self) -> dict:
+        '''
+        Return:
+            - live: the number of sessions in the store
+            - expired: the number of expired sessions removed so far
+            - evicted: the number of sessions evicted from the full store
+            - tracked: the number of entries of the expiration index
+        '''
+        self.reap_expired_sessions()
+        with self._expirations_lock:
+            tracked = len(self._expirations)
+            expired = self.expired
+        return {
+            'live': len(self.user_id_by_session_id),
+            'expired': expired,
+            'evicted': self.user_id_by_session_id.evicted,
+            'tracked': tracked,
+        }
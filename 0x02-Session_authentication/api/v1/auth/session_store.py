@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+'''Session store Module'''
+
+
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import threading
+
+
+# value of pop() without default
+_MISSING = object()
+
+
+class SessionStore(MutableMapping):
+    '''
+    thread-safe mapping of session ids to their values, split in shards
+    with one lock each so threads working on different sessions don't
+    wait for each other.
+    each shard keeps at most max_size / shards sessions, the least
+    recently used ones are evicted beyond that
+    '''
+
+    def __init__(self, max_size: int = 100000, shards: int = 16):
+        '''Initializing the instance'''
+        self.shards = max(shards, 1)
+        self.max_size = max_size
+        self.shard_size = max(-(-max_size // self.shards), 1)
+        self._locks = [threading.Lock() for _ in range(self.shards)]
+        self._shards = [OrderedDict() for _ in range(self.shards)]
+        # evictions of each shard, updated under the lock of the shard
+        self._evicted = [0] * self.shards
+
+    @property
+    def evicted(self) -> int:
+        '''number of sessions evicted from all shards'''
+        return sum(self._evicted)
+
+    def _shard(self, session_id: str) -> int:
+        '''the index of the shard of a session id'''
+        return hash(session_id) % self.shards
+
+    def get(self, session_id: str, default=None):
+        '''the value of a session id (marked as recently used)'''
+        index = self._shard(session_id)
+        with self._locks[index]:
+            shard = self._shards[index]
+            if session_id not in shard:
+                return default
+            shard.move_to_end(session_id)
+            return shard[session_id]
+
+    def __getitem__(self, session_id: str):
+        '''the value of a session id'''
+        value = self.get(session_id, _MISSING)
+        if value is _MISSING:
+            raise KeyError(session_id)
+        return value
+
+    def __setitem__(self, session_id: str, value) -> None:
+        '''store a session, evicting the least recently used if full'''
+        index = self._shard(session_id)
+        with self._locks[index]:
+            shard = self._shards[index]
+            shard[session_id] = value
+            shard.move_to_end(session_id)
+            while len(shard) > self.shard_size:
+                shard.popitem(last=False)
+                self._evicted[index] += 1
+
+    def pop(self, session_id: str, default=_MISSING):
+        '''remove a session and return its value'''
+        index = self._shard(session_id)
+        with self._locks[index]:
+            value = self._shards[index].pop(session_id, default)
+        if value is _MISSING:
+            raise KeyError(session_id)
+        return value
+
+    def pop_if(self, session_id: str, predicate) -> bool:
+        '''
+        remove a session if predicate(value) is true, atomically
+        Return:
+            - True if the session was removed
+        '''
+        index = self._shard(session_id)
+        with self._locks[index]:
+            shard = self._shards[index]
+            if session_id not in shard or not predicate(shard[session_id]):
+                return False
+            del shard[session_id]
+            return True
+
+    def __delitem__(self, session_id: str) -> None:
+        '''remove a session'''
+        self.pop(session_id)
+
+    def __contains__(self, session_id) -> bool:
+        '''check a session id without marking it as used'''
+        index = self._shard(session_id)
+        with self._locks[index]:
+            return session_id in self._shards[index]
+
+    def __iter__(self):
+        '''iterate over a snapshot of the session ids'''
+        for index in range(self.shards):
+            with self._locks[index]:
+                session_ids = list(self._shards[index])
+            yield from session_ids
+
+    def __len__(self) -> int:
+        '''number of sessions'''
+        return sum(len(shard) for shard in self._shards)
+
+    def clear(self) -> None:
+        '''remove all sessions'''
+        for index in range(self.shards):
+            with self._locks[index]:
+                self._shards[index].clear()
+
+    def copy(self) -> dict:
+        '''a dictionary of all sessions, in shard order'''
+        sessions = {}
+        for index in range(self.shards):
+            with self._locks[index]:
+                sessions.update(self._shards[index])
+        return sessions
+
+    def __repr__(self) -> str:
+        '''the sessions, represented as a dictionary'''
+        return repr(self.copy())
@@ -2,18 +2,91 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import (Response, abort, current_app, json, jsonify, request,
+                   stream_with_context)
 from models.user import User
 
 
+# body of the last GET /api/v1/users response: (User.changes(), body),
+# not used when User.changes() is None (store shared between processes)
+_all_users = None
+
+
+# maximum number of users of a page of GET /api/v1/users?limit=
+MAX_PAGE_SIZE = 1000
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: number of users of a page, ordered by ID
+      - cursor: ID of the last user of the previous page
+      - stream: 'json' or 'ndjson' to stream the users instead
     Return:
       - list of all User objects JSON represented
+      - with limit: {"users": [...], "next_cursor": ID or null}
+      - 400 if the parameters are not valid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    global _all_users
+
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    stream = request.args.get('stream')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+        limit = min(limit, MAX_PAGE_SIZE)
+    if stream is not None:
+        if stream not in ('json', 'ndjson'):
+            return jsonify({'error': "stream must be json or ndjson"}), 400
+        return stream_users(stream, cursor, limit)
+    if limit is not None or cursor is not None:
+        users = list(User.iterate(cursor, None if limit is None
+                                  else limit + 1))
+        next_cursor = None
+        if limit is not None and len(users) > limit:
+            users = users[:limit]
+            next_cursor = users[-1].id
+        return jsonify({'users': [user.to_json() for user in users],
+                        'next_cursor': next_cursor})
+
+    changes = User.changes()
+    if changes is None:
+        return jsonify([user.to_json() for user in User.all()])
+    if _all_users is None or _all_users[0] != changes:
+        all_users = [user.to_json() for user in User.all()]
+        _all_users = (changes, jsonify(all_users).get_data())
+    return current_app.response_class(_all_users[1],
+                                      mimetype='application/json')
+
+
+def stream_users(stream: str, cursor: str = None,
+                 limit: int = None) -> Response:
+    """ Stream the users ordered by ID, as a JSON list or as one JSON
+    object per line (ndjson), without building the whole response
+    """
+    def generate_json():
+        yield '['
+        separator = ''
+        for user in User.iterate(cursor, limit):
+            yield separator + json.dumps(user.to_json())
+            separator = ','
+        yield ']\n'
+
+    def generate_ndjson():
+        for user in User.iterate(cursor, limit):
+            yield json.dumps(user.to_json()) + '\n'
+
+    if stream == 'ndjson':
+        return Response(stream_with_context(generate_ndjson()),
+                        mimetype='application/x-ndjson')
+    return Response(stream_with_context(generate_json()),
+                    mimetype='application/json')
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -70,12 +143,22 @@ def create_user() -> str:
       - 400 if can't create the new User
     """
     rj = None
-    error_msg = None
     try:
         rj = request.get_json()
     except Exception as e:
         rj = None
-    if rj is None:
+    result, status = _create_user(rj)
+    return jsonify(result), status
+
+
+def _create_user(rj: dict) -> tuple:
+    """ Create a User from a JSON body
+    Return:
+      - (User object JSON represented, 201)
+      - ({'error': message}, 400) if can't create the new User
+    """
+    error_msg = None
+    if not isinstance(rj, dict):
         error_msg = "Wrong format"
     if error_msg is None and rj.get("email", "") == "":
         error_msg = "email missing"
@@ -89,10 +172,10 @@ def create_user() -> str:
             user.first_name = rj.get("first_name")
             user.last_name = rj.get("last_name")
             user.save()
-            return jsonify(user.to_json()), 201
+            return user.to_json(), 201
         except Exception as e:
             error_msg = "Can't create User: {}".format(e)
-    return jsonify({'error': error_msg}), 400
+    return {'error': error_msg}, 400
 
 
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
@@ -118,11 +201,86 @@ def update_user(user_id: str = None) -> str:
         rj = request.get_json()
     except Exception as e:
         rj = None
-    if rj is None:
-        return jsonify({'error': "Wrong format"}), 400
+    result, status = _update_user(user, rj)
+    return jsonify(result), status
+
+
+def _update_user(user: User, rj: dict) -> tuple:
+    """ Update the names of a User from a JSON body
+    Return:
+      - (User object JSON represented, 200)
+      - ({'error': "Wrong format"}, 400) if can't update the User
+    """
+    if not isinstance(rj, dict):
+        return {'error': "Wrong format"}, 400
     if rj.get('first_name') is not None:
         user.first_name = rj.get('first_name')
     if rj.get('last_name') is not None:
         user.last_name = rj.get('last_name')
     user.save()
-    return jsonify(user.to_json()), 200
+    return user.to_json(), 200
+
+
+# maximum number of operations of POST /api/v1/users/batch
+MAX_BATCH_SIZE = 10000
+
+
+@app_views.route('/users/batch', methods=['POST'], strict_slashes=False)
+def batch_users() -> str:
+    """ POST /api/v1/users/batch
+    JSON body:
+      - list of operations, each one with an "op":
+        - "create": same fields as POST /api/v1/users
+        - "update": "id" and the fields of PUT /api/v1/users/:id
+        - "delete": "id"
+    Return:
+      - list of the results, in the order of the operations:
+        {"status": <HTTP status>, "user": ...} or
+        {"status": <HTTP status>, "error": ...}
+      - 400 if the body is not a list of at most MAX_BATCH_SIZE items
+    The changes are written to the store once, after all operations
+    """
+    rj = None
+    try:
+        rj = request.get_json()
+    except Exception as e:
+        rj = None
+    if not isinstance(rj, list):
+        return jsonify({'error': "Wrong format"}), 400
+    if len(rj) > MAX_BATCH_SIZE:
+        return jsonify({'error': "Too many operations (max {})"
+                        .format(MAX_BATCH_SIZE)}), 400
+
+    results = []
+    with User.batch():
+        for operation in rj:
+            results.append(_batch_operation(operation))
+    return jsonify(results), 200
+
+
+def _batch_operation(operation: dict) -> dict:
+    """ Apply one operation of a batch
+    Return:
+      - the result of the operation with its HTTP status
+    """
+    if not isinstance(operation, dict):
+        return {'status': 400, 'error': "Wrong format"}
+    op = operation.get('op')
+    if op == 'create':
+        result, status = _create_user(operation)
+    elif op in ('update', 'delete'):
+        user = None
+        if isinstance(operation.get('id'), str):
+            user = User.get(operation.get('id'))
+        if user is None:
+            return {'status': 404, 'error': "Not found"}
+        if op == 'delete':
+            user.remove()
+            return {'status': 200}
+        result, status = _update_user(user, operation)
+    else:
+        return {'status': 400, 'error': "Unknown op"}
+
+    if status >= 400:
+        return {'status': status, 'error': result['error']}
+    return {'status': status, 'user': result}
@@ -2,39 +2,112 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
-import json
+from functools import lru_cache
+from typing import Callable, TypeVar, List, Iterable, Iterator, Optional
+from os import getenv
+import itertools
 import uuid
 
+# DATA and INDEXES are re-exported for the modules reading the JSON store
+from models.engine.json_storage import DATA, INDEXES, JSONStorage
+from models.engine.sqlite_storage import SQLiteStorage
+from models.engine.storage import Storage
+
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+# when enabled, the models keep their attributes in __slots__ instead of
+# a per-instance __dict__ (far less memory per object)
+COMPACT = getenv('MODELS_COMPACT', '0') == '1'
+# MODELS_STORAGE selects the engine: 'json' (default) or 'sqlite'
+_storage = None
+# value of the __slots__ attributes not set
+_UNSET = object()
+# last change (save, remove or load) of each class, from _CHANGE_COUNTER
+_CHANGES = {}
+_CHANGE_COUNTER = itertools.count(1)
+# callbacks called with every object saved or removed, by class name
+_LISTENERS = {}
+
+
+def storage() -> Storage:
+    """ Return the storage engine, created on first use
+    """
+    global _storage
+
+    if _storage is None:
+        if getenv('MODELS_STORAGE', 'json') == 'sqlite':
+            _storage = SQLiteStorage(
+                getenv('MODELS_SQLITE_PATH', '.db.sqlite3'))
+        else:
+            _storage = JSONStorage()
+    return _storage
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string, fromisoformat reads the same
+    format many times faster than strptime
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def format_timestamp(value: datetime) -> str:
+    """ Format a datetime with TIMESTAMP_FORMAT
+    """
+    if value.tzinfo is None and value.year >= 1000:
+        return value.isoformat(timespec='seconds')
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+@lru_cache(maxsize=None)
+def slot_names(cls: type) -> tuple:
+    """ The __slots__ attributes of a class and its parents, parents first
+    """
+    names = []
+    for klass in reversed(cls.__mro__):
+        for name in klass.__dict__.get('__slots__', ()):
+            if name not in ('__dict__', '__weakref__'):
+                names.append(name)
+    return tuple(names)
 
 
 class Base():
     """ Base class
     """
 
+    # attributes with a secondary index, for hash lookups in search()
+    __indexes__ = ()
+    if COMPACT:
+        __slots__ = ('id', 'created_at', 'updated_at')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+        storage().register(self.__class__)
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
+    if not COMPACT:
+        # the compact objects don't cache their JSON, it would cost more
+        # memory than __slots__ saves
+        def __setattr__(self, name: str, value):
+            """ Set an attribute, the cached JSON of the object is dropped
+            """
+            object.__setattr__(self, name, value)
+            if name != '_json_cache':
+                object.__setattr__(self, '_json_cache', None)
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -45,68 +118,115 @@ class Base():
         return (self.id == other.id)
 
     def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+        """ Convert the object a JSON dictionary, the result is cached
+        until the next attribute write (unless COMPACT)
+        """
+        if COMPACT:
+            return self._to_json(for_serialization)
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            cache = [None, None]
+            object.__setattr__(self, '_json_cache', cache)
+        if cache[for_serialization] is None:
+            cache[for_serialization] = self._to_json(for_serialization)
+        return dict(cache[for_serialization])
+
+    def _to_json(self, for_serialization: bool) -> dict:
+        """ Build the JSON dictionary of the object
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in self.attributes():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
+                result[key] = format_timestamp(value)
             else:
                 result[key] = value
         return result
 
+    def attributes(self) -> Iterable[tuple]:
+        """ Iterate over the (name, value) of the object attributes,
+        kept in __slots__ and/or __dict__
+        """
+        for name in slot_names(self.__class__):
+            value = getattr(self, name, _UNSET)
+            if value is not _UNSET:
+                yield name, value
+        if hasattr(self, '__dict__'):
+            for name, value in self.__dict__.items():
+                if name != '_json_cache':
+                    yield name, value
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        storage().load(cls)
+        cls.changed()
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
-
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+        storage().flush(cls)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage().save(self)
+        self.changed()
+        self._notify()
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage().remove(self)
+        self.changed()
+        self._notify()
+
+    @classmethod
+    def add_listener(cls, callback: Callable[[TypeVar('Base')], None]):
+        """ Call callback(obj) after every save() or remove() of an
+        object of the class
+        """
+        _LISTENERS.setdefault(cls.__name__, []).append(callback)
+
+    def _notify(self):
+        """ Call the listeners of the class with the object
+        """
+        for callback in _LISTENERS.get(self.__class__.__name__, ()):
+            callback(self)
+
+    @classmethod
+    def changed(cls):
+        """ Record a change of the objects of the class
+        """
+        _CHANGES[cls.__name__] = next(_CHANGE_COUNTER)
+
+    @classmethod
+    def changes(cls) -> Optional[int]:
+        """ Return a number identifying the last change of the objects of
+        the class, a result computed from them is valid while it's the same
+        Return None if the store is shared with other processes, whose
+        changes can't be seen
+        """
+        if storage().shared:
+            return None
+        return _CHANGES.get(cls.__name__, 0)
+
+    @classmethod
+    def batch(cls):
+        """ Context manager writing the saves and removals of its block
+        (in the current thread) to the store at once
+        """
+        return storage().batch()
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return storage().count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -118,21 +238,28 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return storage().get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
+        return storage().search(cls, attributes)
 
-        return list(filter(_search, DATA[s_class].values()))
+    @classmethod
+    def iterate(cls, after: str = None, limit: int = None,
+                batch_size: int = 1000) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects ordered by ID, starting after the ID
+        after, the objects are read batch_size at a time
+        """
+        count = 0
+        while limit is None or count < limit:
+            size = batch_size
+            if limit is not None:
+                size = min(size, limit - count)
+            objs = storage().page(cls, after, size)
+            yield from objs
+            count += len(objs)
+            if len(objs) < size:
+                return
+            after = objs[-1].id
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+""" JSON file storage engine: every class is kept in memory in DATA
+and persisted to a .db_<class>.json snapshot (and journal)
+"""
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, TypeVar
+from os import getenv, path
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import threading
+
+from models.engine.lazy_objects import (LazyObjects, map_snapshot,
+                                        scan_snapshot)
+from models.engine.storage import Storage
+
+
+DATA = {}
+# INDEXES[class][attribute][value] = {id: None} (ordered set of ids)
+INDEXES = {}
+# indexed values of each saved object: _INDEXED[class][id][attribute]
+_INDEXED = {}
+# when enabled, save()/remove() append to .db_<class>.journal and the
+# .db_<class>.json snapshot is only rewritten every JOURNAL_COMPACT_AFTER
+JOURNAL = getenv('MODELS_JOURNAL', '0') == '1'
+JOURNAL_COMPACT_AFTER = int(getenv('MODELS_JOURNAL_COMPACT_AFTER', '1000'))
+# number of records in the journal of each class
+_JOURNAL_SIZE = {}
+# saves within MODELS_SAVE_DELAY seconds are grouped in a single write
+SAVE_DELAY = float(getenv('MODELS_SAVE_DELAY', '0'))
+# pending grouped saves: _SAVE_TIMERS[class] = (cls, timer)
+_SAVE_TIMERS = {}
+_SAVE_LOCK = threading.Lock()
+# when enabled, load() only maps the snapshot and the objects are built
+# on first access (see models.engine.lazy_objects)
+LAZY_LOAD = getenv('MODELS_LAZY_LOAD', '0') == '1'
+# classes whose indexes are rebuilt on their next search
+_STALE_INDEXES = set()
+# classes changed by the running batch of each thread, with their
+# pending journal records: _BATCH.pending[class] = (cls, records)
+_BATCH = threading.local()
+# IDs of each class in sorted order for page(), built on first use
+_SORTED_IDS = {}
+# lock of the snapshot and journal files of each class
+_FILE_LOCKS = {}
+_FILE_LOCKS_LOCK = threading.Lock()
+
+
+def _file_lock(s_class: str) -> threading.RLock:
+    """ The lock of the snapshot and journal files of a class, a journal
+    append can't happen between the snapshot and the journal removal
+    """
+    with _FILE_LOCKS_LOCK:
+        return _FILE_LOCKS.setdefault(s_class, threading.RLock())
+
+
+def _fsync_directory(directory: str):
+    """ Flush a directory entry to disk, so a rename in it survives a crash
+    """
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class JSONStorage(Storage):
+    """ JSON file storage engine
+    """
+
+    def __init__(self):
+        """ Initialize the engine
+        """
+        atexit.register(self.flush_pending_saves)
+
+    def register(self, cls: type):
+        """ Make sure the class has its objects dictionary
+        """
+        if DATA.get(cls.__name__) is None:
+            DATA[cls.__name__] = {}
+
+    def load(self, cls: type):
+        """ Load all objects from file, a grouped save of the class not
+        written yet is written first so its changes are not lost
+        """
+        with _file_lock(cls.__name__):
+            if self._take_pending_save(cls):
+                self._flush(cls)
+            self._load(cls)
+
+    def _load(self, cls: type):
+        """ Read the snapshot and journal of a class into DATA,
+        the file lock of the class must be held
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        DATA[s_class] = {}
+        _SORTED_IDS.pop(s_class, None)
+        if path.exists(file_path) and LAZY_LOAD:
+            self._map(cls, file_path)
+        elif path.exists(file_path):
+            with open(file_path, 'r') as f:
+                objs_json = json.load(f)
+                for obj_id, obj_json in objs_json.items():
+                    DATA[s_class][obj_id] = cls(**obj_json)
+        self._replay_journal(cls)
+        if isinstance(DATA[s_class], LazyObjects):
+            # reading the indexed values is deferred to the first search
+            _STALE_INDEXES.add(s_class)
+        else:
+            self._rebuild_indexes(cls)
+
+    def _map(self, cls: type, file_path: str):
+        """ Load the objects of a snapshot lazily, falls back to a full
+        load if the snapshot can't be scanned
+        """
+        buffer = map_snapshot(file_path)
+        if buffer is None:
+            return
+        spans = scan_snapshot(buffer)
+        if spans is None:
+            buffer.close()
+            with open(file_path, 'r') as f:
+                for obj_id, obj_json in json.load(f).items():
+                    DATA[cls.__name__][obj_id] = cls(**obj_json)
+            return
+        DATA[cls.__name__] = LazyObjects(cls, buffer, spans)
+
+    def _replay_journal(self, cls: type):
+        """ Apply the journal records on top of the loaded snapshot
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        _JOURNAL_SIZE[s_class] = 0
+        if not path.exists(journal_path):
+            return
+
+        torn = False
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write of the last record
+                    torn = True
+                    break
+                if record['op'] == 'save':
+                    DATA[s_class][record['id']] = cls(**record['obj'])
+                else:
+                    DATA[s_class].pop(record['id'], None)
+                _JOURNAL_SIZE[s_class] += 1
+
+        if torn:
+            # start a clean journal, new records can't follow a torn one
+            self.flush(cls)
+
+    def append_to_journal(self, op: str, obj: TypeVar('Base')):
+        """ Append a 'save' or 'remove' record of an object to the journal,
+        the journal is compacted into the snapshot when it gets too long
+        """
+        self._write_journal(obj.__class__, [self._journal_record(op, obj)])
+
+    @staticmethod
+    def _journal_record(op: str, obj: TypeVar('Base')) -> dict:
+        """ The journal record of a 'save' or 'remove' of an object
+        """
+        record = {'op': op, 'id': obj.id}
+        if op == 'save':
+            record['obj'] = obj.to_json(True)
+        return record
+
+    def _write_journal(self, cls: type, records: List[dict]):
+        """ Append records to the journal of a class in one write
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        with _file_lock(s_class):
+            with open(journal_path, 'a') as f:
+                f.write(''.join(json.dumps(record) + '\n'
+                                for record in records))
+
+            _JOURNAL_SIZE[s_class] = \
+                _JOURNAL_SIZE.get(s_class, 0) + len(records)
+            if _JOURNAL_SIZE[s_class] >= JOURNAL_COMPACT_AFTER:
+                self.flush(cls)
+
+    def flush(self, cls: type):
+        """ Save all objects to file
+        """
+        with _file_lock(cls.__name__):
+            self._flush(cls)
+
+    def _flush(self, cls: type):
+        """ Write the snapshot of a class and remove its journal,
+        the file lock of the class must be held
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        objs = DATA[s_class]
+        objs_json = {}
+        if isinstance(objs, LazyObjects):
+            # the objects not accessed yet are copied without building them
+            for obj_id in list(objs):
+                objs_json[obj_id] = objs.raw(obj_id)
+        else:
+            for obj_id, obj in list(objs.items()):
+                objs_json[obj_id] = obj.to_json(True)
+
+        # write a temporary file then rename it, so a crash never leaves
+        # a truncated snapshot and readers see either version; the
+        # snapshot is built under the file lock so writers can't rename
+        # an older version over a newer one
+        directory = path.dirname(file_path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix="{}.".format(file_path),
+                                        dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(objs_json, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        _fsync_directory(directory)
+
+        # the snapshot now holds every journal record
+        journal_path = ".db_{}.journal".format(s_class)
+        if path.exists(journal_path):
+            os.remove(journal_path)
+        _JOURNAL_SIZE[s_class] = 0
+
+    def schedule_save(self, cls: type):
+        """ Save all objects to file, after SAVE_DELAY seconds so the
+        saves happening in between are written at once
+        """
+        if SAVE_DELAY <= 0:
+            self.flush(cls)
+            return
+
+        with _SAVE_LOCK:
+            if cls.__name__ in _SAVE_TIMERS:
+                return
+            timer = threading.Timer(SAVE_DELAY, self._save_scheduled, (cls,))
+            timer.daemon = True
+            _SAVE_TIMERS[cls.__name__] = (cls, timer)
+            timer.start()
+
+    def _take_pending_save(self, cls: type, timer=None) -> bool:
+        """ Cancel the grouped save of a class (only if it's timer when
+        given), the caller writes the snapshot instead
+        Return:
+          - True if a grouped save was pending
+        """
+        with _SAVE_LOCK:
+            pending = _SAVE_TIMERS.get(cls.__name__)
+            if pending is None or (timer is not None and
+                                   pending[1] is not timer):
+                return False
+            del _SAVE_TIMERS[cls.__name__]
+        pending[1].cancel()
+        return True
+
+    def _save_scheduled(self, cls: type):
+        """ Write the snapshot of a grouped save, unless load() or
+        flush_pending_saves() wrote it already
+        """
+        with _file_lock(cls.__name__):
+            if self._take_pending_save(cls, threading.current_thread()):
+                self._flush(cls)
+
+    def flush_pending_saves(self):
+        """ Write the snapshots of the grouped saves not written yet
+        """
+        with _SAVE_LOCK:
+            pending = [cls for cls, _ in _SAVE_TIMERS.values()]
+        for cls in pending:
+            with _file_lock(cls.__name__):
+                if self._take_pending_save(cls):
+                    self._flush(cls)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """ Write the snapshot (or the journal records) of the classes
+        changed in the block once, at its end
+        """
+        if getattr(_BATCH, 'pending', None) is not None:
+            yield
+            return
+        _BATCH.pending = pending = {}
+        try:
+            yield
+        finally:
+            _BATCH.pending = None
+            for cls, records in pending.values():
+                if JOURNAL:
+                    self._write_journal(cls, records)
+                else:
+                    self.schedule_save(cls)
+
+    def _persist(self, op: str, obj: TypeVar('Base')):
+        """ Write a 'save' or 'remove' of an object to the store, or add
+        it to the running batch
+        """
+        cls = obj.__class__
+        pending = getattr(_BATCH, 'pending', None)
+        if pending is not None:
+            records = pending.setdefault(cls.__name__, (cls, []))[1]
+            if JOURNAL:
+                records.append(self._journal_record(op, obj))
+        elif JOURNAL:
+            self.append_to_journal(op, obj)
+        else:
+            self.schedule_save(cls)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Save current object
+        """
+        cls = obj.__class__
+        ids = _SORTED_IDS.get(cls.__name__)
+        if ids is not None and obj.id not in DATA[cls.__name__]:
+            bisect.insort(ids, obj.id)
+        DATA[cls.__name__][obj.id] = obj
+        self._index(cls, obj.id, {attr: getattr(obj, attr, None)
+                                  for attr in cls.__indexes__})
+        self._persist('save', obj)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Remove object
+        """
+        cls = obj.__class__
+        if DATA[cls.__name__].get(obj.id) is not None:
+            del DATA[cls.__name__][obj.id]
+            self._unindex(cls, obj.id)
+            ids = _SORTED_IDS.get(cls.__name__)
+            if ids is not None:
+                i = bisect.bisect_left(ids, obj.id)
+                if i < len(ids) and ids[i] == obj.id:
+                    del ids[i]
+            self._persist('remove', obj)
+
+    def _unindex(self, cls: type, obj_id: str):
+        """ Remove an object from the secondary indexes
+        """
+        s_class = cls.__name__
+        indexes = INDEXES.setdefault(s_class, {})
+        values = _INDEXED.setdefault(s_class, {}).pop(obj_id, {})
+        for attr, value in values.items():
+            ids = indexes[attr].get(value)
+            if ids is not None:
+                ids.pop(obj_id, None)
+                if len(ids) == 0:
+                    del indexes[attr][value]
+
+    def _index(self, cls: type, obj_id: str, attributes: dict):
+        """ Add (or move) an object in the secondary indexes,
+        attributes holds the values of the indexed attributes
+        """
+        s_class = cls.__name__
+        self._unindex(cls, obj_id)
+        indexes = INDEXES.setdefault(s_class, {})
+        values = {}
+        for attr, value in attributes.items():
+            try:
+                ids = indexes.setdefault(attr, {}).setdefault(value, {})
+            except TypeError:
+                # unhashable values are only found by a full scan
+                continue
+            ids[obj_id] = None
+            values[attr] = value
+        _INDEXED[s_class][obj_id] = values
+
+    def _rebuild_indexes(self, cls: type):
+        """ Index all the objects of the class
+        """
+        s_class = cls.__name__
+        _STALE_INDEXES.discard(s_class)
+        INDEXES[s_class] = {attr: {} for attr in cls.__indexes__}
+        _INDEXED[s_class] = {}
+        if len(cls.__indexes__) == 0:
+            return
+
+        objs = DATA[s_class]
+        lazy = isinstance(objs, LazyObjects)
+        for obj_id in list(objs):
+            if lazy and not objs.is_loaded(obj_id):
+                obj_json = objs.raw(obj_id)
+                attributes = {attr: obj_json.get(attr)
+                              for attr in cls.__indexes__}
+            else:
+                attributes = {attr: getattr(objs[obj_id], attr, None)
+                              for attr in cls.__indexes__}
+            self._index(cls, obj_id, attributes)
+
+    def count(self, cls: type) -> int:
+        """ Count all objects
+        """
+        return len(DATA[cls.__name__].keys())
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        return DATA[cls.__name__].get(id)
+
+    def search(self, cls: type,
+               attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+        """
+        s_class = cls.__name__
+        objs = DATA[s_class]
+        if s_class in _STALE_INDEXES:
+            self._rebuild_indexes(cls)
+
+        def _search(obj):
+            if len(attributes) == 0:
+                return True
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        candidates = objs.values()
+        for k, v in attributes.items():
+            if k not in cls.__indexes__:
+                continue
+            try:
+                ids = INDEXES.get(s_class, {}).get(k, {}).get(v, {})
+            except TypeError:
+                continue
+            candidates = [objs[obj_id] for obj_id in ids if obj_id in objs]
+            break
+
+        return list(filter(_search, candidates))
+
+    def page(self, cls: type, after: Optional[str],
+             limit: int) -> List[TypeVar('Base')]:
+        """ Return up to limit objects ordered by ID, after the ID after
+        """
+        s_class = cls.__name__
+        objs = DATA[s_class]
+        ids = _SORTED_IDS.get(s_class)
+        if ids is None:
+            ids = _SORTED_IDS[s_class] = sorted(objs)
+        start = 0 if after is None else bisect.bisect_right(ids, after)
+        return [objs[obj_id] for obj_id in ids[start:start + limit]
+                if obj_id in objs]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+""" Lazy objects dictionary for the JSON storage engine: the snapshot
+is memory-mapped, only the position of every object is read at load
+time and the objects are built on first access
+"""
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, Optional, Tuple
+import json
+import mmap
+import re
+
+
+# one `"<id>": {<flat object>}` entry of a snapshot written by json.dump,
+# followed by the `,` of the next entry or the closing `}`
+_ENTRY = re.compile(
+    rb'\s*"((?:[^"\\]+|\\.)*)"\s*:\s*'
+    rb'(\{(?:[^{}"]+|"(?:[^"\\]+|\\.)*")*\})\s*([,}])',
+    re.S)
+_START = re.compile(rb'\s*\{')
+_EMPTY = re.compile(rb'\s*\}\s*$')
+
+
+def scan_snapshot(buffer) -> Optional[Dict[str, Tuple[int, int]]]:
+    """ Find the (start, end) offsets of every object of a snapshot
+    Return:
+      - the offsets by object ID, in file order
+      - None if the snapshot is not a mapping of flat JSON objects
+    """
+    start = _START.match(buffer)
+    if start is None:
+        return None
+    pos = start.end()
+    if _EMPTY.match(buffer, pos):
+        return {}
+
+    spans = {}
+    while True:
+        match = _ENTRY.match(buffer, pos)
+        if match is None:
+            return None
+        key = match.group(1)
+        if b'\\' in key:
+            key = json.loads(b'"' + key + b'"')
+        else:
+            key = key.decode()
+        spans[key] = match.span(2)
+        pos = match.end()
+        if match.group(3) == b'}':
+            return spans
+
+
+def map_snapshot(file_path: str):
+    """ Memory-map a snapshot file read-only
+    Return:
+      - the mapping, None if the file is empty
+    """
+    with open(file_path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+
+
+class LazyObjects(MutableMapping):
+    """ Objects of a class by ID, the objects not accessed yet are only
+    stored as their offsets in the memory-mapped snapshot
+    """
+
+    def __init__(self, cls: type, buffer, spans: Dict[str, Tuple[int, int]]):
+        """ Initialize the dictionary
+        """
+        self._cls = cls
+        self._buffer = buffer
+        self._entries = dict(spans)
+
+    def is_loaded(self, key: str) -> bool:
+        """ Check if the object of an ID has been built already
+        """
+        return not isinstance(self._entries[key], tuple)
+
+    def raw(self, key: str) -> dict:
+        """ The JSON dictionary of an object, without building it
+        """
+        value = self._entries[key]
+        if isinstance(value, tuple):
+            return json.loads(self._buffer[value[0]:value[1]])
+        return value.to_json(True)
+
+    def __getitem__(self, key: str):
+        """ Return the object of an ID, building it on first access
+        """
+        value = self._entries[key]
+        if isinstance(value, tuple):
+            value = self._cls(**self.raw(key))
+            self._entries[key] = value
+        return value
+
+    def __setitem__(self, key: str, value):
+        """ Add or replace an object
+        """
+        self._entries[key] = value
+
+    def __delitem__(self, key: str):
+        """ Remove an object
+        """
+        del self._entries[key]
+
+    def __contains__(self, key) -> bool:
+        """ Check an ID without building its object
+        """
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over the IDs
+        """
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        """ Number of objects
+        """
+        return len(self._entries)
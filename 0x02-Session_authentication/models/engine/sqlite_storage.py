@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+""" SQLite storage engine: one table per class, the object is stored
+as JSON next to one indexed column per attribute of __indexes__
+"""
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, TypeVar
+import json
+import sqlite3
+import threading
+
+from models.engine.storage import Storage
+
+
+# values that can be stored in an indexed column as is
+_SQL_TYPES = (str, int, float, type(None))
+
+
+class SQLiteStorage(Storage):
+    """ SQLite storage engine
+    """
+
+    # the database file can be written by other workers
+    shared = True
+
+    def __init__(self, db_path: str = ".db.sqlite3"):
+        """ Initialize the engine, every thread gets its own connection
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._tables = set()
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """ The connection of the current thread
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _column_value(value):
+        """ The value stored in an indexed column
+        """
+        return value if isinstance(value, _SQL_TYPES) else None
+
+    def _table(self, cls: type) -> str:
+        """ Create the table of a class (and its indexes) if needed
+        Return:
+          - the quoted table name
+        """
+        s_class = cls.__name__
+        table = '"{}"'.format(s_class)
+        if s_class in self._tables:
+            return table
+
+        with self._lock:
+            connection = self.connection
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} "
+                "(id TEXT PRIMARY KEY, obj TEXT NOT NULL)".format(table))
+            columns = [row[1] for row in connection.execute(
+                "PRAGMA table_info({})".format(table))]
+            for attr in cls.__indexes__:
+                if attr not in columns:
+                    connection.execute("ALTER TABLE {} ADD COLUMN \"{}\""
+                                       .format(table, attr))
+                    self._backfill(cls, table, attr)
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS \"{0}_{1}\" ON {2} (\"{1}\")"
+                    .format(s_class, attr, table))
+            connection.commit()
+            self._tables.add(s_class)
+        return table
+
+    def _backfill(self, cls: type, table: str, attr: str):
+        """ Fill a new indexed column from the stored objects
+        """
+        rows = self.connection.execute(
+            "SELECT id, obj FROM {}".format(table)).fetchall()
+        for obj_id, obj in rows:
+            value = self._column_value(json.loads(obj).get(attr))
+            self.connection.execute(
+                "UPDATE {} SET \"{}\" = ? WHERE id = ?".format(table, attr),
+                (value, obj_id))
+
+    def load(self, cls: type):
+        """ Nothing to load, the objects are read on demand
+        """
+        self._table(cls)
+
+    def _commit(self):
+        """ Commit the changes, unless a batch of the thread is running
+        """
+        if not getattr(self._local, 'batch', False):
+            self.connection.commit()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """ Run the saves and removals of the block in one transaction
+        """
+        if getattr(self._local, 'batch', False):
+            yield
+            return
+        self._local.batch = True
+        try:
+            yield
+        finally:
+            self._local.batch = False
+            self.connection.commit()
+
+    def flush(self, cls: type):
+        """ Commit the pending changes
+        """
+        self._table(cls)
+        self.connection.commit()
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update an object
+        """
+        cls = obj.__class__
+        table = self._table(cls)
+        columns = ['id', 'obj'] + ['"{}"'.format(attr)
+                                   for attr in cls.__indexes__]
+        values = [obj.id, json.dumps(obj.to_json(True))] + \
+            [self._column_value(getattr(obj, attr, None))
+             for attr in cls.__indexes__]
+        updates = ', '.join('{0} = excluded.{0}'.format(column)
+                            for column in columns[1:])
+        self.connection.execute(
+            "INSERT INTO {} ({}) VALUES ({}) ON CONFLICT(id) DO UPDATE SET {}"
+            .format(table, ', '.join(columns),
+                    ', '.join('?' * len(columns)), updates),
+            values)
+        self._commit()
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete an object
+        """
+        table = self._table(obj.__class__)
+        self.connection.execute(
+            "DELETE FROM {} WHERE id = ?".format(table), (obj.id,))
+        self._commit()
+
+    def count(self, cls: type) -> int:
+        """ Count all objects
+        """
+        table = self._table(cls)
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM {}".format(table)).fetchone()[0]
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        table = self._table(cls)
+        row = self.connection.execute(
+            "SELECT obj FROM {} WHERE id = ?".format(table),
+            (id,)).fetchone()
+        if row is None:
+            return None
+        return cls(**json.loads(row[0]))
+
+    def search(self, cls: type,
+               attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes, the indexed
+        attributes are filtered by SQLite, the others in Python
+        """
+        table = self._table(cls)
+        where, params = [], []
+        for k, v in attributes.items():
+            if k in cls.__indexes__ and isinstance(v, _SQL_TYPES):
+                where.append('"{}" IS ?'.format(k))
+                params.append(v)
+
+        query = "SELECT obj FROM {}".format(table)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY rowid"
+
+        result = []
+        for (obj_json,) in self.connection.execute(query, params):
+            obj = cls(**json.loads(obj_json))
+            if all(getattr(obj, k) == v for k, v in attributes.items()):
+                result.append(obj)
+        return result
+
+    def page(self, cls: type, after: Optional[str],
+             limit: int) -> List[TypeVar('Base')]:
+        """ Return up to limit objects ordered by ID, after the ID after,
+        read from the primary key index
+        """
+        table = self._table(cls)
+        query, params = "SELECT obj FROM {}".format(table), []
+        if after is not None:
+            query += " WHERE id > ?"
+            params.append(after)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        return [cls(**json.loads(obj_json)) for (obj_json,)
+                in self.connection.execute(query, params)]
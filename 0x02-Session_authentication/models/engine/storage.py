@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+""" Storage engine interface
+"""
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, TypeVar
+
+
+class Storage():
+    """ Interface of the storage engines behind models.base.Base,
+    every method receives the model class (or object) it works on
+    """
+
+    # True if other processes can write to the same store
+    shared = False
+
+    def register(self, cls: type):
+        """ Called for every new instance of a model class
+        """
+        pass
+
+    def load(self, cls: type):
+        """ (Re)load all objects of a class from the store
+        """
+        raise NotImplementedError
+
+    def flush(self, cls: type):
+        """ Write all pending changes of a class to the store
+        """
+        raise NotImplementedError
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update an object
+        """
+        raise NotImplementedError
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete an object
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """ Group the saves and removals of the block, in the current
+        thread, in a single write to the store
+        """
+        yield
+
+    def count(self, cls: type) -> int:
+        """ Count all objects of a class
+        """
+        raise NotImplementedError
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID, None if not found
+        """
+        raise NotImplementedError
+
+    def search(self, cls: type,
+               attributes: dict) -> List[TypeVar('Base')]:
+        """ Return all objects with matching attributes
+        """
+        raise NotImplementedError
+
+    def page(self, cls: type, after: Optional[str],
+             limit: int) -> List[TypeVar('Base')]:
+        """ Return up to limit objects ordered by ID, starting after the
+        ID after (from the first object if None)
+        """
+        raise NotImplementedError
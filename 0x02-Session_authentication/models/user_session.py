@@ -2,12 +2,16 @@
 '''Sessions in database'''
 
 
-from models.base import Base
+from models.base import Base, COMPACT
 
 
 class UserSession(Base):
     '''class to store session Ids'''
 
+    __indexes__ = ('session_id',)
+    if COMPACT:
+        __slots__ = ('user_id', 'session_id')
+
     def __init__(self, *args: list, **kwargs: dict):
         '''initializing the instance'''
         super().__init__(*args, **kwargs)
@@ -4,11 +4,13 @@
 
 from flask import Flask, abort, jsonify, make_response, redirect, request
 
-from auth import Auth
+from auth import HASHER, Auth
 
 
 app = Flask(__name__)
 AUTH = Auth()
+# fork the hashing workers before the server runs its threads
+HASHER.start()
 
 
 @app.route('/', methods=['GET'])
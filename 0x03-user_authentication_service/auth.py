@@ -4,13 +4,16 @@
 
 from typing import Optional
 import uuid
-import bcrypt
 
 from db import DB
+from hashing import HashingService
 from user import User
 from sqlalchemy.orm.exc import NoResultFound
 
 
+HASHER = HashingService()
+
+
 def _hash_password(password: str) -> bytes:
     '''
     hashing a password
@@ -20,7 +23,7 @@ def _hash_password(password: str) -> bytes:
         - the hashed password as bytes
     '''
 
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    return HASHER.hash_password(password)
 
 
 def _generate_uuid() -> str:
@@ -73,7 +76,7 @@ class Auth:
         try:
             user = self._db.find_user_by(email=email)
             if user:
-                if bcrypt.checkpw(password.encode(), user.hashed_password):
+                if HASHER.is_valid(user.hashed_password, password):
                     return True
 
         except NoResultFound:
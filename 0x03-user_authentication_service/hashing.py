@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+'''Running bcrypt off the request threads'''
+
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from queue import Full
+
+import bcrypt
+
+
+# the bcrypt.gensalt() default work factor
+ROUNDS = 12
+
+
+def get_rounds() -> int:
+    '''the work factor used for new hashes'''
+    return ROUNDS
+
+
+def _mp_context():
+    '''
+    the start method of the worker processes: fork, the forkserver and
+    spawn workers import the main script again (and re-run its side
+    effects), so the pool is started by HashingService.start() before
+    the process runs threads; spawn only where fork is not available
+    '''
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+
+def _noop() -> None:
+    '''the operation starting the workers'''
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    '''hash a password, runs in a worker process'''
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    '''check a password, runs in a worker process'''
+    return bcrypt.checkpw(password, hashed_password)
+
+
+# HashingService is kept identical in 0x00-personal_data/encrypt_password.py
+# and 0x03-user_authentication_service/hashing.py, the projects are
+# standalone directories that can't import each other
+class HashingService:
+    '''
+    runs bcrypt in a pool of worker processes so the calling threads
+    (or event loop) are not blocked for the whole hashing time,
+    at most max_pending operations are queued, callers beyond that wait
+    for a free slot (backpressure) and fail with queue.Full on timeout
+    '''
+
+    def __init__(self, workers: int = None, max_pending: int = 64):
+        '''initializing the instance'''
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.waited = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        '''the process pool, started on first use'''
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=_mp_context())
+            return self._executor
+
+    def start(self) -> None:
+        '''
+        start the worker processes now, to call at startup before the
+        process runs threads (a web server) since they are forked,
+        the first operation starts them otherwise
+        '''
+        self.executor.submit(_noop).result()
+
+    def _acquire(self, timeout: float = None) -> None:
+        '''wait for a free slot in the queue'''
+        if self._slots.acquire(blocking=False):
+            return
+        with self._lock:
+            self.waited += 1
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.rejected += 1
+            raise Full('too many pending hashing operations')
+
+    def _done(self, future: Future) -> None:
+        '''free the slot of a finished operation'''
+        self._slots.release()
+        with self._lock:
+            self.completed += 1
+
+    def _submit(self, fn, *args) -> Future:
+        '''submit an operation, a slot must have been acquired'''
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.submitted += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def submit_hash(self, password: str, timeout: float = None) -> Future:
+        '''queue the hashing of a password, the future holds the hash'''
+        self._acquire(timeout)
+        return self._submit(_hashpw, password.encode(), get_rounds())
+
+    def submit_check(self, hashed_password: bytes, password: str,
+                     timeout: float = None) -> Future:
+        '''queue a password check, the future holds the result'''
+        self._acquire(timeout)
+        return self._submit(_checkpw, password.encode(), hashed_password)
+
+    def hash_password(self, password: str, timeout: float = None) -> bytes:
+        '''hashing the password in a worker process'''
+        return self.submit_hash(password, timeout).result()
+
+    def is_valid(self, hashed_password: bytes, password: str,
+                 timeout: float = None) -> bool:
+        '''check if a hashed password is valid in a worker process'''
+        return self.submit_check(hashed_password, password, timeout).result()
+
+    async def hash_password_async(self, password: str,
+                                  timeout: float = None) -> bytes:
+        '''hashing the password without blocking the event loop'''
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(
+            None, self.submit_hash, password, timeout)
+        return await asyncio.wrap_future(future)
+
+    async def is_valid_async(self, hashed_password: bytes, password: str,
+                             timeout: float = None) -> bool:
+        '''check a password without blocking the event loop'''
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(
+            None, self.submit_check, hashed_password, password, timeout)
+        return await asyncio.wrap_future(future)
+
+    def metrics(self) -> dict:
+        '''the backpressure counters of the service'''
+        with self._lock:
+            return {
+                'pending': self.submitted - self.completed,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'waited': self.waited,
+                'rejected': self.rejected,
+            }
+
+    def close(self) -> None:
+        '''wait for the pending operations and stop the workers'''
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)